@@ -1,14 +1,18 @@
 from __future__ import annotations
 
-import asyncio
-from dataclasses import dataclass
+import hashlib
+import secrets
 from pathlib import Path
-from typing import List, Optional
+from typing import Any
 
-from fastapi import Body, FastAPI, File, HTTPException, UploadFile
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+import orjson
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import AnnouncementManager, read_route_file
 
 
 BASE_DIR = Path(__file__).parent
@@ -64,225 +68,215 @@ PRESET_ANNOUNCEMENTS = [
     },
 ]
 
+# Die Sonderansagen ändern sich zur Laufzeit nicht und werden nur einmal serialisiert.
+_PRESETS_BODY = orjson.dumps({"presets": PRESET_ANNOUNCEMENTS})
+_PRESET_INDEX = {
+    preset["id"]: orjson.dumps({"message": preset["message"], "preset": preset})
+    for preset in PRESET_ANNOUNCEMENTS
+}
 
-@dataclass
-class Route:
-    """Repräsentiert eine Streckenliste."""
-
-    name: str
-    stations: List[str]
-
-
-class AnnouncementManager:
-    """Verwaltet die Abfolge der abzuspielenden Ansagen."""
-
-    def __init__(self) -> None:
-        self._route: Optional[Route] = None
-        self._welcome_played = False
-        self._next_index = 1
-        self._finished = False
-        self._last_message: Optional[str] = None
-
-    def load_route(self, route: Route) -> None:
-        self._route = route
-        self._welcome_played = False
-        self._finished = False
-        self._last_message = None
-        self._next_index = 1 if len(route.stations) > 1 else 0
-
-    def reset(self) -> None:
-        self._route = None
-        self._welcome_played = False
-        self._finished = False
-        self._last_message = None
-        self._next_index = 1
-
-    def has_route(self) -> bool:
-        return self._route is not None
-
-    def current_route(self) -> Optional[Route]:
-        return self._route
-
-    def _ensure_route(self) -> Route:
-        if not self._route:
-            raise RuntimeError("Keine Strecke geladen.")
-        return self._route
-
-    def next_message(self) -> str:
-        route = self._ensure_route()
-        if self._finished:
-            raise RuntimeError("Alle Ansagen wurden bereits abgespielt.")
-
-        if not self._welcome_played:
-            self._welcome_played = True
-            start = route.stations[0]
-            end = route.stations[-1]
-            text = (
-                f"Willkommen im Zug nach {end}."
-                "Bitte achten Sie auf Ihre Gepäckstücke und wir wünschen Ihnen eine angenehme Fahrt."
-            )
-            self._last_message = text
-            return text
-
-        if len(route.stations) == 1:
-            text = (
-                f"Wir erreichen in wenigen Augenblicken die Endstation {route.stations[0]}. "
-                "Bitte steigen Sie aus. Vielen Dank, dass Sie mit uns gefahren sind."
-            )
-            self._finished = True
-            self._last_message = text
-            return text
-
-        if self._next_index >= len(route.stations):
-            self._finished = True
-            farewell = (
-                "Wir haben bereits alle Stationen erreicht. "
-                "Vielen Dank, dass Sie mit uns gefahren sind."
-            )
-            self._last_message = farewell
-            return farewell
-
-        station = route.stations[self._next_index]
-        if self._next_index == len(route.stations) - 1:
-            text = (
-                f"Wir erreichen in wenigen Augenblicken die Endstation {station}. "
-                "Bitte nehmen Sie alle persönlichen Gegenstände mit. Vielen Dank, dass Sie mit uns gefahren sind."
-            )
-            self._finished = True
-        else:
-            text = f"Nächster Halt: {station}."
-
-        self._next_index += 1
-        self._last_message = text
-        return text
-
-    def repeat_last(self) -> str:
-        if not self._last_message:
-            raise RuntimeError("Es wurde noch keine Ansage abgespielt.")
-        return self._last_message
-
-    def next_station_name(self) -> Optional[str]:
-        if not self._route or self._finished:
-            return None
-        if len(self._route.stations) == 1:
-            return self._route.stations[0]
-        if self._next_index >= len(self._route.stations):
-            return None
-        return self._route.stations[self._next_index]
-
-    def is_finished(self) -> bool:
-        return self._finished
-
-
-def read_route_file(raw_bytes: bytes, filename: str) -> Route:
-    path = Path(filename)
-    name = path.stem or "Unbenannte Strecke"
-    for encoding in ("utf-8", "latin-1"):
-        try:
-            content = raw_bytes.decode(encoding)
-            break
-        except UnicodeDecodeError:
-            continue
-    else:  # pragma: no cover - defensive fallback
-        raise ValueError("Die Datei konnte nicht gelesen werden.")
-
-    stations = [line.strip() for line in content.splitlines() if line.strip()]
-    if not stations:
-        raise ValueError("Die Datei enthält keine gültigen Stationen.")
-    return Route(name=name, stations=stations)
+# Die Startseite wird einmal beim Start eingelesen; Änderungen greifen nach einem Neustart.
+_INDEX_BODY = (STATIC_DIR / "index.html").read_bytes()
+_INDEX_HEADERS = {
+    "ETag": f'"{hashlib.md5(_INDEX_BODY, usedforsecurity=False).hexdigest()}"',
+    "Cache-Control": "public, max-age=60",
+}
 
 
-announcement_manager = AnnouncementManager()
-state_lock = asyncio.Lock()
-
-app = FastAPI(title="Zug Ansagen Web")
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+class ORJSONResponse(JSONResponse):
+    """JSON-Antwort, die direkt mit orjson serialisiert wird."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+_CORS_ALLOW_ORIGIN = (b"access-control-allow-origin", b"*")
+_CORS_PREFLIGHT_HEADERS = (
+    _CORS_ALLOW_ORIGIN,
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-max-age", b"600"),
 )
+
+
+class StaticCORSMiddleware:
+    """Erlaubt Fernsteuerung von beliebigen Origins mit fest vorbereiteten CORS-Headern.
+
+    Die API nutzt keine Cookies; es genügt daher, ``*`` anzuhängen und
+    Preflight-Anfragen direkt zu beantworten.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS":
+            request_headers = dict(scope["headers"])
+            if b"access-control-request-method" in request_headers:
+                headers = list(_CORS_PREFLIGHT_HEADERS)
+                requested = request_headers.get(b"access-control-request-headers")
+                if requested:
+                    headers.append((b"access-control-allow-headers", requested))
+                await send({"type": "http.response.start", "status": 200, "headers": headers})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        async def send_with_cors(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), _CORS_ALLOW_ORIGIN]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
+# Zustandsübergänge laufen ohne await zwischen Lesen und Schreiben und damit atomar auf
+# der Event-Loop; ein Lock ist nicht nötig. Der Zustand liegt im Prozess (ein Worker).
+announcement_manager = AnnouncementManager()
+# Versionsnummern beginnen nach jedem Neustart wieder bei 0; das Präfix hält ETags eindeutig.
+_STATE_ETAG_PREFIX = secrets.token_hex(4)
+
+app = FastAPI(title="Zug Ansagen Web", default_response_class=ORJSONResponse)
+app.add_middleware(StaticCORSMiddleware)
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 
 def serialize_state() -> dict:
     route = announcement_manager.current_route()
+    next_index = announcement_manager.current_index()
     return {
         "routeLoaded": bool(route),
         "routeName": route.name if route else None,
-        "stations": route.stations if route else [],
-        "nextStation": announcement_manager.next_station_name(),
+        "stations": route.stations if route else (),
+        "nextStation": route.stations[next_index] if route and next_index is not None else None,
+        "nextIndex": next_index,
         "finished": announcement_manager.is_finished(),
     }
 
 
-@app.get("/", response_class=FileResponse)
-async def index() -> FileResponse:
-    return FileResponse(STATIC_DIR / "index.html")
+def state_body() -> bytes:
+    body = announcement_manager.cached_state()
+    if body is None:
+        body = orjson.dumps(serialize_state())
+        announcement_manager.cache_state(body)
+    return body
+
+
+def state_response() -> Response:
+    return Response(content=state_body(), media_type="application/json")
+
+
+@app.get("/", response_class=Response)
+async def index(request: Request) -> Response:
+    if request.headers.get("if-none-match") == _INDEX_HEADERS["ETag"]:
+        return Response(status_code=304, headers=_INDEX_HEADERS)
+    return Response(content=_INDEX_BODY, media_type="text/html", headers=_INDEX_HEADERS)
 
 
 @app.get("/api/state")
-async def get_state() -> dict:
-    async with state_lock:
-        return serialize_state()
+async def get_state(request: Request) -> Response:
+    headers = {
+        "ETag": f'W/"{_STATE_ETAG_PREFIX}-{announcement_manager.version()}"',
+        "Cache-Control": "no-cache",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=state_body(), media_type="application/json", headers=headers)
 
 
 @app.get("/api/presets")
-async def get_presets() -> dict:
-    return {"presets": PRESET_ANNOUNCEMENTS}
+async def get_presets() -> Response:
+    return Response(content=_PRESETS_BODY, media_type="application/json")
+
+
+@app.get("/api/script")
+async def get_script() -> ORJSONResponse:
+    if not announcement_manager.has_route():
+        return ORJSONResponse({"messages": []})
+    messages = announcement_manager.enumerate_messages()
+    return ORJSONResponse({"messages": [{"key": key, "text": text} for key, text in messages]})
 
 
 @app.post("/api/route")
-async def upload_route(file: UploadFile = File(...)) -> dict:
-    data = await file.read()
+async def upload_route(file: UploadFile = File(...)) -> Response:
     try:
-        route = read_route_file(data, file.filename or "strecke.txt")
+        # Die Datei wird zeilenweise aus dem Upload-Puffer gelesen, ohne die Event-Loop zu blockieren.
+        route = await run_in_threadpool(read_route_file, file.file, file.filename or "strecke.txt")
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    async with state_lock:
-        announcement_manager.load_route(route)
-        return serialize_state()
+    announcement_manager.load_route(route)
+    return state_response()
 
 
 @app.post("/api/next")
-async def next_message() -> dict:
-    async with state_lock:
-        try:
-            message = announcement_manager.next_message()
-        except RuntimeError as exc:
-            raise HTTPException(status_code=400, detail=str(exc)) from exc
-        state = serialize_state()
-        return {"message": message, "state": state}
+async def next_message() -> Response:
+    try:
+        message = announcement_manager.next_message()
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    upcoming = announcement_manager.peek_message()
+    # Der Zustand wird als fertiger Body eingesetzt und bleibt für folgende /api/state Abrufe im Cache.
+    body = b"".join(
+        (
+            b'{"message":',
+            orjson.dumps(message),
+            b',"upcoming":',
+            orjson.dumps(upcoming),
+            b',"state":',
+            state_body(),
+            b"}",
+        )
+    )
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/api/repeat")
-async def repeat_message() -> dict:
-    async with state_lock:
-        try:
-            message = announcement_manager.repeat_last()
-        except RuntimeError as exc:
-            raise HTTPException(status_code=400, detail=str(exc)) from exc
-        return {"message": message}
+async def repeat_message() -> ORJSONResponse:
+    try:
+        message = announcement_manager.repeat_last()
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return ORJSONResponse({"message": message})
 
 
 @app.post("/api/preset")
-async def trigger_preset(preset_id: str = Body(..., embed=True, alias="presetId")) -> dict:
-    preset = next((item for item in PRESET_ANNOUNCEMENTS if item["id"] == preset_id), None)
-    if not preset:
+async def trigger_preset(request: Request) -> Response:
+    # Ein einzelnes Feld: direkt mit orjson lesen statt ein Pydantic-Modell zu validieren.
+    try:
+        preset_id = orjson.loads(await request.body())["presetId"]
+    except (orjson.JSONDecodeError, KeyError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Ungültige Anfrage: presetId fehlt.") from exc
+    if not isinstance(preset_id, str):
+        raise HTTPException(status_code=400, detail="Ungültige Anfrage: presetId muss ein Text sein.")
+    body = _PRESET_INDEX.get(preset_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="Unbekannte Sonderansage.")
-    return {"message": preset["message"], "preset": preset}
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/api/reset")
-async def reset() -> dict:
-    async with state_lock:
-        announcement_manager.reset()
-        return serialize_state()
+async def reset() -> Response:
+    announcement_manager.reset()
+    return state_response()
 
 
 if __name__ == "__main__":
+    import os
+
     import uvicorn
 
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    # Der Ansagezustand liegt im Prozess, daher genau ein Worker. uvloop und httptools
+    # wählt uvicorn automatisch, sofern installiert (uvicorn[standard]).
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=1,
+        reload=os.getenv("DEV", "").lower() in {"1", "true", "yes"},
+        access_log=False,
+        server_header=False,
+        date_header=False,
+    )
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import codecs
+import functools
+import io
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+
+@dataclass(frozen=True, slots=True)
+class Route:
+    """Repräsentiert eine Streckenliste."""
+
+    name: str
+    stations: Tuple[str, ...]
+
+
+def _welcome_text(end: str) -> str:
+    return (
+        f"Willkommen im Zug nach {end}."
+        "Bitte achten Sie auf Ihre Gepäckstücke und wir wünschen Ihnen eine angenehme Fahrt."
+    )
+
+
+def _next_stop_text(station: str) -> str:
+    return f"Nächster Halt: {station}."
+
+
+def _end_station_text(station: str) -> str:
+    return (
+        f"Wir erreichen in wenigen Augenblicken die Endstation {station}. "
+        "Bitte nehmen Sie alle persönlichen Gegenstände mit. Vielen Dank, dass Sie mit uns gefahren sind."
+    )
+
+
+def _single_station_text(station: str) -> str:
+    return (
+        f"Wir erreichen in wenigen Augenblicken die Endstation {station}. "
+        "Bitte steigen Sie aus. Vielen Dank, dass Sie mit uns gefahren sind."
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _build_script(stations: Tuple[str, ...]) -> Tuple[Tuple[str, str], ...]:
+    """Erzeugt alle Ansagen einer Strecke als ``(key, text)`` Paare in Abspielreihenfolge.
+
+    Zuletzt geladene Strecken bleiben zwischengespeichert, ein erneutes Laden
+    derselben Datei erzeugt die Texte nicht noch einmal.
+    """
+    last = stations[-1]
+    welcome = ("welcome", _welcome_text(last))
+    if len(stations) == 1:
+        return (welcome, ("end", _single_station_text(last)))
+    stops = [
+        (f"station-{index:02d}", _next_stop_text(station))
+        for index, station in enumerate(stations[1:-1], start=1)
+    ]
+    return (welcome, *stops, ("end", _end_station_text(last)))
+
+
+class AnnouncementManager:
+    """Verwaltet die Abfolge der abzuspielenden Ansagen.
+
+    Alle Ansagetexte einer Strecke werden beim Laden einmalig erzeugt; danach
+    schaltet ein Cursor nur noch durch das fertige Skript.
+    """
+
+    __slots__ = (
+        "_route",
+        "_script",
+        "_next_station_indices",
+        "_cursor",
+        "_state_cache_bytes",
+        "_version",
+    )
+
+    def __init__(self) -> None:
+        self._route: Optional[Route] = None
+        self._script: Tuple[Tuple[str, str], ...] = ()
+        self._next_station_indices: List[Optional[int]] = [None]
+        self._cursor = 0
+        self._state_cache_bytes: Optional[bytes] = None
+        self._version = 0
+
+    def load_route(self, route: Route) -> None:
+        following = range(1, len(route.stations)) or range(1)
+        self._route = route
+        self._script = _build_script(route.stations)
+        # Index der nächsten Station je Cursorposition; nach der letzten Ansage gibt es keine mehr.
+        self._next_station_indices = [following[0], *following, None]
+        self._cursor = 0
+        self._state_cache_bytes = None
+        self._version += 1
+
+    def reset(self) -> None:
+        self._route = None
+        self._script = ()
+        self._next_station_indices = [None]
+        self._cursor = 0
+        self._state_cache_bytes = None
+        self._version += 1
+
+    def has_route(self) -> bool:
+        return self._route is not None
+
+    def current_route(self) -> Optional[Route]:
+        return self._route
+
+    def _ensure_route(self) -> Route:
+        if not self._route:
+            raise RuntimeError("Keine Strecke geladen.")
+        return self._route
+
+    def enumerate_messages(self) -> List[Tuple[str, str]]:
+        """Liefert alle Ansagen der geladenen Strecke als ``(key, text)`` Paare.
+
+        Entspricht der Abfolge von ``next_message``, damit Clients die Texte
+        bereits beim Laden der Strecke vorab synthetisieren können.
+        """
+        self._ensure_route()
+        return list(self._script)
+
+    def next_message(self) -> str:
+        self._ensure_route()
+        cursor = self._cursor
+        script = self._script
+        if cursor >= len(script):
+            raise RuntimeError("Alle Ansagen wurden bereits abgespielt.")
+        text = script[cursor][1]
+        self._cursor = cursor + 1
+        self._state_cache_bytes = None
+        self._version += 1
+        return text
+
+    def peek_message(self) -> Optional[str]:
+        """Liefert die Ansage, die ``next_message`` als Nächstes erzeugt, ohne weiterzuschalten."""
+        if self._cursor >= len(self._script):
+            return None
+        return self._script[self._cursor][1]
+
+    def repeat_last(self) -> str:
+        if not self._cursor:
+            raise RuntimeError("Es wurde noch keine Ansage abgespielt.")
+        return self._script[self._cursor - 1][1]
+
+    def current_index(self) -> Optional[int]:
+        """Index der nächsten Station in ``route.stations`` oder ``None``."""
+        return self._next_station_indices[self._cursor]
+
+    def next_station_name(self) -> Optional[str]:
+        index = self.current_index()
+        if index is None or not self._route:
+            return None
+        return self._route.stations[index]
+
+    def version(self) -> int:
+        """Zählt jede Zustandsänderung; dient Clients als Validierungsmerkmal."""
+        return self._version
+
+    def cached_state(self) -> Optional[bytes]:
+        """Zuletzt serialisierter Zustand; jede Zustandsänderung verwirft ihn."""
+        return self._state_cache_bytes
+
+    def cache_state(self, body: bytes) -> None:
+        self._state_cache_bytes = body
+
+    def is_finished(self) -> bool:
+        return self._route is not None and self._cursor >= len(self._script)
+
+
+_BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def _decode_line(raw: bytes) -> str:
+    """Dekodiert eine Zeile als UTF-8 und fällt nur für diese Zeile auf Latin-1 zurück."""
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+
+def _iter_lines(fp: BinaryIO) -> Iterator[str]:
+    """Liefert die nicht leeren Zeilen; Leerzeilen werden schon als Bytes verworfen."""
+    for raw in fp:
+        for line in filter(None, map(bytes.strip, raw.splitlines())):
+            yield _decode_line(line)
+
+
+def _read_utf16_stations(fp: BinaryIO) -> Tuple[str, ...]:
+    text = io.TextIOWrapper(fp, encoding="utf-16")
+    try:
+        return tuple(filter(None, map(str.strip, text)))
+    except UnicodeDecodeError as exc:
+        raise ValueError("Die Datei konnte nicht gelesen werden.") from exc
+    finally:
+        # Der Wrapper darf die hochgeladene Datei beim Aufräumen nicht schließen.
+        text.detach()
+
+
+def read_route_file(fp: BinaryIO, filename: str) -> Route:
+    """Liest eine Streckendatei zeilenweise und in einem Durchgang aus einem binären Dateiobjekt."""
+    path = Path(filename)
+    name = path.stem or "Unbenannte Strecke"
+    head = fp.read(len(codecs.BOM_UTF8))
+    encoding = next((enc for bom, enc in _BOM_ENCODINGS if head.startswith(bom)), None)
+    if encoding == "utf-16":
+        fp.seek(0)
+        stations = _read_utf16_stations(fp)
+    else:
+        fp.seek(len(codecs.BOM_UTF8) if encoding == "utf-8-sig" else 0)
+        stations = tuple(filter(None, map(str.strip, _iter_lines(fp))))
+
+    if not stations:
+        raise ValueError("Die Datei enthält keine gültigen Stationen.")
+    return Route(name=name, stations=stations)
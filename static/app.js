@@ -35,6 +35,10 @@ const state = {
   openaiKey: "",
   openaiVoice: "alloy",
   currentAudio: null,
+  speechGeneration: 0,
+  browserVoice: null,
+  busy: false,
+  precacheRun: 0,
 };
 
 function stopCurrentAudio() {
@@ -49,22 +53,67 @@ function stopCurrentAudio() {
   }
 }
 
+function resolveBrowserVoice() {
+  const voices = window.speechSynthesis.getVoices();
+  state.browserVoice =
+    voices.find((voice) => voice.lang === "de-DE") ??
+    voices.find((voice) => voice.lang?.toLowerCase().startsWith("de")) ??
+    null;
+}
+
+function warmUpBrowserSpeech() {
+  // Eine stumme Äußerung lädt die Sprach-Engine, bevor die erste echte Ansage kommt.
+  // Browser erlauben speak() erst nach einer Nutzerinteraktion.
+  if (state.ttsMode !== "browser") return;
+  const utterance = new SpeechSynthesisUtterance(" ");
+  utterance.volume = 0;
+  window.speechSynthesis.speak(utterance);
+}
+
+function warmUpOpenAI() {
+  // Verbindungsaufbau (DNS, TLS) vorziehen, damit die erste Synthese nicht darauf wartet.
+  if (document.querySelector("link[rel='preconnect'][href='https://api.openai.com']")) return;
+  const link = document.createElement("link");
+  link.rel = "preconnect";
+  link.href = "https://api.openai.com";
+  document.head.append(link);
+}
+
+if ("speechSynthesis" in window) {
+  resolveBrowserVoice();
+  window.speechSynthesis.addEventListener("voiceschanged", resolveBrowserVoice);
+  document.addEventListener("pointerdown", warmUpBrowserSpeech, { once: true });
+}
+
 function speakWithBrowser(message) {
   if (!("speechSynthesis" in window)) {
     showToast("Browser unterstützt keine Sprachsynthese.", "error");
     return;
   }
-  window.speechSynthesis.cancel();
+  state.speechGeneration += 1;
+  stopCurrentAudio();
+  const synth = window.speechSynthesis;
+  // Nur abbrechen, wenn wirklich etwas läuft oder wartet.
+  if (synth.speaking || synth.pending) {
+    synth.cancel();
+  }
   const utterance = new SpeechSynthesisUtterance(message);
   utterance.lang = "de-DE";
-  window.speechSynthesis.speak(utterance);
+  if (state.browserVoice) {
+    utterance.voice = state.browserVoice;
+  }
+  synth.speak(utterance);
 }
 
-async function speakWithOpenAI(message) {
-  if (!state.openaiKey) {
-    throw new Error("Bitte OpenAI API Key hinterlegen.");
-  }
-  stopCurrentAudio();
+const PRECACHE_CONCURRENCY = 2;
+const OPENAI_KEY_PATTERN = /^sk-[A-Za-z0-9_-]{20,}$/;
+const audioCache = new Map(); // `${voice}\u0000${text}` -> Promise<Object URL> der gerenderten Ansage
+
+function audioCacheKey(message, voice = state.openaiVoice) {
+  return `${voice}\u0000${message}`;
+}
+
+async function synthesizeWithOpenAI(message, voice) {
   const response = await fetch("https://api.openai.com/v1/audio/speech", {
     method: "POST",
     headers: {
@@ -73,7 +122,7 @@ async function speakWithOpenAI(message) {
     },
     body: JSON.stringify({
       model: "gpt-4o-mini-tts",
-      voice: state.openaiVoice,
+      voice,
       input: message,
       format: "mp3",
     }),
@@ -84,14 +133,140 @@ async function speakWithOpenAI(message) {
   }
   const arrayBuffer = await response.arrayBuffer();
   const blob = new Blob([arrayBuffer], { type: "audio/mpeg" });
-  const url = URL.createObjectURL(blob);
+  return URL.createObjectURL(blob);
+}
+
+function revokeAudioUrl(url) {
+  const audio = state.currentAudio;
+  if (audio && audio.src === url) {
+    // Läuft gerade: erst freigeben, wenn die Wiedergabe endet oder gestoppt wird.
+    const revoke = () => URL.revokeObjectURL(url);
+    audio.addEventListener("ended", revoke, { once: true });
+    audio.addEventListener("emptied", revoke, { once: true });
+    return;
+  }
+  URL.revokeObjectURL(url);
+}
+
+function clearAudioCache() {
+  // Bei einem Stimmwechsel ist keine gerenderte Ansage mehr verwendbar.
+  state.speechGeneration += 1;
+  audioCache.forEach((pending) => pending.then(revokeAudioUrl, () => {}));
+  audioCache.clear();
+}
+
+function pruneAudioCache(texts) {
+  // Nur Ansagen behalten, die im Skript der neuen Strecke vorkommen; ein erneuter
+  // Upload derselben Strecke braucht so keine neue Synthese.
+  const keep = new Set(texts);
+  let evicted = false;
+  audioCache.forEach((pending, key) => {
+    if (!keep.has(key.slice(key.indexOf("\u0000") + 1))) {
+      audioCache.delete(key);
+      pending.then(revokeAudioUrl, () => {});
+      evicted = true;
+    }
+  });
+  if (evicted) {
+    state.speechGeneration += 1;
+  }
+}
+
+function renderAudio(message, voice = state.openaiVoice) {
+  // Laufende Renderings (Vorab-Cache, Lookahead) werden geteilt statt doppelt angefragt.
+  const key = audioCacheKey(message, voice);
+  let pending = audioCache.get(key);
+  if (!pending) {
+    pending = synthesizeWithOpenAI(message, voice);
+    audioCache.set(key, pending);
+    pending.catch(() => {
+      if (audioCache.get(key) === pending) {
+        audioCache.delete(key);
+      }
+    });
+  }
+  return pending;
+}
+
+async function speakWithOpenAI(message) {
+  if (!state.openaiKey) {
+    throw new Error("Bitte OpenAI API Key hinterlegen.");
+  }
+  stopCurrentAudio();
+  const generation = ++state.speechGeneration;
+  const url = await renderAudio(message);
+  if (generation !== state.speechGeneration) {
+    // Eine neuere Ansage wurde angefordert, während diese noch gerendert wurde.
+    return;
+  }
   const audio = new Audio(url);
   state.currentAudio = audio;
-  audio.play().finally(() => {
-    URL.revokeObjectURL(url);
+  try {
+    await audio.play();
+  } catch (error) {
+    // Ein Barge-in pausiert die Wiedergabe, bevor play() aufgelöst ist.
+    if (error?.name === "AbortError" && generation !== state.speechGeneration) {
+      return;
+    }
+    throw error;
+  }
+}
+
+function prefetchAudio(message) {
+  if (!message || !state.autoSpeak || state.ttsMode !== "openai" || !state.openaiKey) {
+    return;
+  }
+  renderAudio(message).catch(() => {
+    // Live-Synthese beim Abspielen übernimmt.
   });
 }
 
+function cancelPrecache() {
+  state.precacheRun += 1;
+}
+
+async function fetchScriptTexts() {
+  const response = await fetch("/api/script");
+  if (!response.ok) {
+    return null;
+  }
+  const data = await response.json();
+  return (data.messages ?? []).map((item) => item.text);
+}
+
+async function refreshAudioCache() {
+  const texts = await fetchScriptTexts();
+  if (texts) {
+    pruneAudioCache(texts);
+  }
+  await precacheScript(texts);
+}
+
+async function precacheScript(texts = null) {
+  // Jeder Lauf bekommt ein Token; Upload, Reset oder ein neuer Lauf beenden die alten Worker.
+  cancelPrecache();
+  const run = state.precacheRun;
+  if (!state.autoSpeak || state.ttsMode !== "openai" || !state.openaiKey) {
+    return;
+  }
+  const script = texts ?? (await fetchScriptTexts());
+  if (!script || run !== state.precacheRun) {
+    return;
+  }
+  const pending = script.filter((text) => !audioCache.has(audioCacheKey(text)));
+  const worker = async () => {
+    while (pending.length && run === state.precacheRun) {
+      const text = pending.shift();
+      try {
+        await renderAudio(text);
+      } catch (_) {
+        // Live-Synthese beim Abspielen übernimmt.
+      }
+    }
+  };
+  await Promise.all(Array.from({ length: PRECACHE_CONCURRENCY }, worker));
+}
+
 async function speak(message) {
   if (!state.autoSpeak) {
     return;
@@ -113,28 +288,62 @@ function showToast(text, variant = "info") {
   setTimeout(() => selectors.toast.classList.remove("show"), 2400);
 }
 
+function syncControls() {
+  // Einzige Stelle, die den Zustand der Aktionsknöpfe schreibt.
+  selectors.playNext.disabled = state.busy || !state.routeLoaded;
+  selectors.repeatLast.disabled = state.busy || !state.lastMessage;
+  selectors.reset.disabled = state.busy || !state.routeLoaded;
+}
+
 function setLoading(isLoading) {
-  selectors.playNext.disabled = isLoading || !state.routeLoaded;
-  selectors.repeatLast.disabled = isLoading || !state.lastMessage;
-  selectors.reset.disabled = isLoading || !state.routeLoaded;
+  state.busy = isLoading;
+  syncControls();
 }
 
-function updateStations(stations, active) {
-  selectors.stationsList.replaceChildren(
-    ...stations.map((station, idx) => {
-      const li = document.createElement("li");
-      if (station === active) {
-        li.classList.add("active");
-      }
-      const badge = document.createElement("span");
-      badge.className = "index";
-      badge.textContent = String(idx + 1).padStart(2, "0");
-      const name = document.createElement("span");
-      name.textContent = station;
-      li.append(badge, name);
-      return li;
-    }),
-  );
+const stationView = {
+  stations: [],
+  activeIndex: null,
+};
+
+function sameStations(a, b) {
+  return a.length === b.length && a.every((station, idx) => station === b[idx]);
+}
+
+const stationRowTemplate = (() => {
+  const li = document.createElement("li");
+  const badge = document.createElement("span");
+  badge.className = "index";
+  li.append(badge, document.createElement("span"));
+  return li;
+})();
+
+function renderStations(stations, activeIndex) {
+  // Ein Fragment statt Spread-Argumenten: ein einziger DOM-Einschub, auch bei sehr langen Strecken.
+  const fragment = document.createDocumentFragment();
+  stations.forEach((station, idx) => {
+    const li = stationRowTemplate.cloneNode(true);
+    if (idx === activeIndex) {
+      li.classList.add("active");
+    }
+    const [badge, name] = li.children;
+    badge.textContent = String(idx + 1).padStart(2, "0");
+    name.textContent = station;
+    fragment.append(li);
+  });
+  selectors.stationsList.replaceChildren(fragment);
+}
+
+function updateStations(stations, activeIndex) {
+  if (!sameStations(stations, stationView.stations)) {
+    renderStations(stations, activeIndex);
+  } else if (activeIndex !== stationView.activeIndex) {
+    // Gleiche Strecke: nur die bisherige und die neue Markierung umschalten.
+    const rows = selectors.stationsList.children;
+    rows[stationView.activeIndex]?.classList.remove("active");
+    rows[activeIndex]?.classList.add("active");
+  }
+  stationView.stations = stations;
+  stationView.activeIndex = activeIndex;
 }
 
 function updateUi(data) {
@@ -149,10 +358,6 @@ function updateUi(data) {
     selectors.uploadInline.hidden = !data.routeLoaded;
   }
 
-  selectors.playNext.disabled = !data.routeLoaded;
-  selectors.repeatLast.disabled = !state.lastMessage;
-  selectors.reset.disabled = !data.routeLoaded;
-
   if (!data.routeLoaded) {
     selectors.routeName.textContent = "Noch keine Strecke geladen";
     selectors.stationCount.textContent = "0 Stationen";
@@ -165,7 +370,7 @@ function updateUi(data) {
   selectors.routeName.textContent = `${data.routeName} • ${data.stations.length} Stationen`;
   selectors.stationCount.textContent = `${data.stations.length} Stationen`;
   selectors.nextStation.textContent = `Nächster Halt: ${data.nextStation ?? "–"}`;
-  updateStations(data.stations, data.nextStation);
+  updateStations(data.stations, data.nextIndex);
 
   if (data.finished) {
     selectors.statusMessage.textContent = "Alle Ansagen wurden abgespielt.";
@@ -179,6 +384,7 @@ async function fetchState() {
   }
   const data = await response.json();
   updateUi(data);
+  syncControls();
 }
 
 function renderPresets() {
@@ -205,7 +411,7 @@ function renderPresets() {
     const button = document.createElement("button");
     button.type = "button";
     button.textContent = "Abspielen";
-    button.addEventListener("click", () => triggerPreset(preset.id));
+    button.dataset.presetId = preset.id;
 
     card.append(title, description, button);
     return card;
@@ -239,9 +445,14 @@ async function handleUpload(file) {
   state.lastMessage = null;
   selectors.statusMessage.textContent = "Strecke geladen. Ansage bereit.";
   updateUi(data);
+  syncControls();
+  cancelPrecache();
+  refreshAudioCache().catch(() => {});
 }
 
 async function triggerNext() {
+  // Klicks während einer laufenden Anfrage verfallen, statt sich aufzustauen.
+  if (state.busy) return;
   setLoading(true);
   try {
     const response = await fetch("/api/next", { method: "POST" });
@@ -253,10 +464,10 @@ async function triggerNext() {
     const message = payload.message;
     state.lastMessage = message;
     selectors.statusMessage.textContent = message;
-    selectors.repeatLast.disabled = false;
     updateUi(payload.state);
     try {
       await speak(message);
+      prefetchAudio(payload.upcoming);
     } catch (error) {
       showToast(error.message, "error");
     }
@@ -282,7 +493,7 @@ async function triggerPreset(presetId) {
     const message = payload.message;
     state.lastMessage = message;
     selectors.statusMessage.textContent = message;
-    selectors.repeatLast.disabled = false;
+    syncControls();
     try {
       await speak(message);
     } catch (error) {
@@ -305,6 +516,7 @@ async function repeatLast() {
 }
 
 async function resetRoute() {
+  cancelPrecache();
   setLoading(true);
   try {
     const response = await fetch("/api/reset", { method: "POST" });
@@ -322,6 +534,13 @@ async function resetRoute() {
   }
 }
 
+selectors.manualPresets.addEventListener("click", (event) => {
+  const button = event.target.closest("button[data-preset-id]");
+  if (button) {
+    triggerPreset(button.dataset.presetId);
+  }
+});
+
 selectors.playNext.addEventListener("click", triggerNext);
 selectors.repeatLast.addEventListener("click", repeatLast);
 selectors.reset.addEventListener("click", resetRoute);
@@ -329,8 +548,12 @@ selectors.reset.addEventListener("click", resetRoute);
 selectors.autoSpeak.addEventListener("change", (event) => {
   state.autoSpeak = event.target.checked;
   if (!state.autoSpeak) {
+    cancelPrecache();
+    state.speechGeneration += 1;
     window.speechSynthesis.cancel();
     stopCurrentAudio();
+  } else if (state.routeLoaded) {
+    precacheScript().catch(() => {});
   }
 });
 
@@ -400,9 +623,28 @@ selectors.settingsForm.addEventListener("submit", (event) => {
   const mode = formData.get("tts-mode") === "openai" ? "openai" : "browser";
   const key = selectors.openaiKey.value.trim();
   const voice = selectors.voiceSelect.value;
+  if (key && !OPENAI_KEY_PATTERN.test(key)) {
+    showToast("Der OpenAI API Key hat ein ungültiges Format (sk-…).", "error");
+    return;
+  }
+  const changed =
+    mode !== state.ttsMode || voice !== state.openaiVoice || key !== state.openaiKey;
+  if (!changed) {
+    closeSettingsModal();
+    return;
+  }
+  if (voice !== state.openaiVoice) {
+    clearAudioCache();
+  }
   state.ttsMode = mode;
   state.openaiVoice = voice;
   state.openaiKey = key;
+  if (mode === "openai" && key) {
+    warmUpOpenAI();
+  }
+  if (state.routeLoaded) {
+    precacheScript().catch(() => {});
+  }
   showToast("Einstellungen aktualisiert", "success");
   closeSettingsModal();
 });